@@ -1,31 +1,104 @@
 import streamlit as st
+import os
+import re
 import pickle
 import numpy as np
+import onnxruntime as ort
 import bcrypt
 import datetime
 import base64
-from io import BytesIO
 from uuid import uuid4
+from concurrent.futures import ThreadPoolExecutor
+from db import HealthcareDB
+
+# bcrypt work factor; lower it (e.g. BCRYPT_COST=10) for dev and load tests
+BCRYPT_COST = int(os.getenv("BCRYPT_COST", "12"))
 
 # --- Load ML Model ---
-with open("disease_predictor.pkl", "rb") as f:
-    model = pickle.load(f)
+@st.cache_resource
+def _load_artifacts():
+    """Load the model and vectorizer once per process, shared across sessions"""
+    session = ort.InferenceSession("model/disease_predictor.onnx",
+                                   providers=["CPUExecutionProvider"])
 
-with open("vectorizer.pkl", "rb") as f:
-    vectorizer = pickle.load(f)
+    with open("vectorizer.pkl", "rb") as f:
+        vectorizer = pickle.load(f)
 
-all_symptoms = vectorizer.get_feature_names_out()
+    all_symptoms = tuple(vectorizer.get_feature_names_out())
+    symptom_index = {s: i for i, s in enumerate(all_symptoms)}
+    return session, vectorizer, all_symptoms, symptom_index
 
-# --- Session Initialization ---
-if "users" not in st.session_state:
-    st.session_state.users = {}
+# Separator between entered symptoms; eats the whitespace around each comma
+_SYMPTOM_SEP = re.compile(r"\s*,\s*")
+
+def _input_buffer(rows, width):
+    """Zeroed model input rows, reused across this session's predictions"""
+    buf = st.session_state.get("_input_buf")
+    if buf is None or buf.shape[0] < rows or buf.shape[1] != width:
+        buf = st.session_state._input_buf = np.zeros((rows, width), dtype=np.float32)
+        return buf
+    buf = buf[:rows]
+    buf.fill(0)
+    return buf
+
+def predict_conditions(symptom_texts):
+    """Predict a condition for each comma-separated symptom text in one model call"""
+    session, _, all_symptoms, symptom_index = _load_artifacts()
+    row_ids, col_ids = [], []
+    for row, text in enumerate(symptom_texts):
+        symptoms = set(_SYMPTOM_SEP.split(text.strip().lower()))
+        symptoms.discard("")
+        # Column indices of the known symptoms, i.e. the nonzeros of the row
+        cols = [symptom_index[s] for s in symptoms if s in symptom_index]
+        row_ids.extend([row] * len(cols))
+        col_ids.extend(cols)
+
+    symptoms_matrix = _input_buffer(len(symptom_texts), len(all_symptoms))
+    symptoms_matrix[row_ids, col_ids] = 1.0
+    prediction = session.run(None, {"X": symptoms_matrix})[0]
+    return [str(p) for p in prediction]
+
+# --- Storage ---
+@st.cache_resource
+def _get_db():
+    """One SQLite connection shared by all sessions"""
+    return HealthcareDB("healthcare.db")
+
+# Older versions of a folder are never requested again; the bound evicts them
+@st.cache_data(show_spinner=False, max_entries=256)
+def _folder_records(username, folder, version, doctor=None):
+    """Newest-first records of a folder, memoized until its version changes"""
+    return _get_db().folder_records(username, folder, doctor)
 
+@st.cache_data(show_spinner=False, max_entries=256)
+def _folder_doctors(username, folder, version):
+    """Doctors with records in a folder, memoized until its version changes"""
+    return _get_db().folder_doctors(username, folder)
+
+# --- Session Initialization ---
 if "logged_in" not in st.session_state:
     st.session_state.logged_in = False
     st.session_state.username = ""
     st.session_state.role = ""
 
 # --- Auth Functions ---
+@st.cache_resource
+def _bcrypt_pool():
+    """Worker pool for bcrypt calls, shared across sessions and reruns"""
+    return ThreadPoolExecutor(max_workers=4)
+
+def _hash_password(password):
+    salt = bcrypt.gensalt(rounds=BCRYPT_COST)
+    return _bcrypt_pool().submit(bcrypt.hashpw, password, salt).result()
+
+def _check_password(password, hashed_password):
+    return _bcrypt_pool().submit(bcrypt.checkpw, password, hashed_password).result()
+
+@st.cache_resource(show_spinner=False)
+def _dummy_hash():
+    """Hash checked against for unknown usernames so misses cost the same as hits"""
+    return bcrypt.hashpw(b"dummy", bcrypt.gensalt(rounds=BCRYPT_COST))
+
 def signup():
     st.subheader("Signup")
     username = st.text_input("Choose Username")
@@ -40,35 +113,33 @@ def signup():
             st.error("Passwords don't match")
         elif len(password) < 8:
             st.error("Password must be at least 8 characters")
-        elif username in st.session_state.users:
+        elif _get_db().get_user(username):
             st.error("Username already exists.")
         else:
-            salt = bcrypt.gensalt()
-            hashed_password = bcrypt.hashpw(password.encode('utf-8'), salt)
+            hashed_password = _hash_password(password.encode('utf-8'))
             
-            st.session_state.users[username] = {
-                "password": hashed_password.decode('utf-8'),
-                "role": role,
-                "medical_history": {} if role == "Patient" else None,
-                "patients": [] if role == "Doctor" else None,
-            }
-            st.success("Signup successful! Please login.")
+            if _get_db().add_user(username, hashed_password, role):
+                st.success("Signup successful! Please login.")
+            else:
+                st.error("Username already exists.")
 
 def login():
+    # Build the dummy hash up front so the first unknown username isn't slower than the rest
+    dummy_hash = _dummy_hash()
     st.subheader("Login")
     username = st.text_input("Username")
     password = st.text_input("Password", type="password")
     
     if st.button("Login"):
-        user = st.session_state.users.get(username)
+        user = _get_db().get_user(username)
+        provided_password = password.encode('utf-8')
         if not user:
+            # Run a full bcrypt check anyway so response time doesn't reveal valid usernames
+            _check_password(provided_password, dummy_hash)
             st.error("Invalid credentials.")
             return
             
-        stored_password = user["password"].encode('utf-8')
-        provided_password = password.encode('utf-8')
-        
-        if bcrypt.checkpw(provided_password, stored_password):
+        if _check_password(provided_password, user["pwd_hash"]):
             st.session_state.logged_in = True
             st.session_state.username = username
             st.session_state.role = user["role"]
@@ -84,12 +155,22 @@ def logout_button():
         st.rerun()
 
 # --- UI Components ---
+def format_ts(ts):
+    return ts.isoformat(sep=" ", timespec="seconds")
+
+# Attachments never change once saved, so the record id alone keys the cache.
+# Bounded so only the last few previewed PDFs stay in memory.
+@st.cache_data(show_spinner=False, max_entries=16, ttl=datetime.timedelta(minutes=30))
+def _pdf_base64(record_id):
+    """Base64 of a record's PDF, read and encoded once per record"""
+    return base64.b64encode(_get_db().file_bytes(record_id)).decode('utf-8')
+
 def display_record(record):
     """Display a single medical record"""
     with st.container(border=True):
         col1, col2 = st.columns([1, 3])
         with col1:
-            st.markdown(f"**Date:** {record.get('timestamp', 'N/A')}")
+            st.markdown(f"**Date:** {format_ts(record['ts'])}")
         with col2:
             st.markdown(f"**Doctor:** Dr. {record.get('doctor', 'N/A')}")
         
@@ -108,21 +189,27 @@ def display_record(record):
             st.markdown(record["allergies"])
         
         if "file" in record and record["file"]:
-            file_bytes = record["file"]["bytes"]
             file_name = record["file"]["name"]
             st.markdown("### Attachments")
             
-            if file_name.lower().endswith(('.png', '.jpg', '.jpeg')):
-                st.image(BytesIO(file_bytes), caption=file_name)
-            elif file_name.lower().endswith('.pdf'):
-                base64_pdf = base64.b64encode(file_bytes).decode('utf-8')
-                pdf_display = f"""
-                <iframe src="data:application/pdf;base64,{base64_pdf}" 
-                        width="100%" height="500px" 
-                        style="border:1px solid #444;"></iframe>
-                """
-                st.markdown(pdf_display, unsafe_allow_html=True)
-                st.download_button("Download PDF", file_bytes, file_name, "application/pdf")
+            # The attachment is only read and sent once the user opens it, so
+            # reruns with it closed do no blob I/O
+            if st.toggle(f"Open {file_name}", key=f"preview_{record['id']}"):
+                is_pdf = file_name.lower().endswith('.pdf')
+                file_bytes = _get_db().file_bytes(record["id"])
+                if file_name.lower().endswith(('.png', '.jpg', '.jpeg')):
+                    st.image(file_bytes, caption=file_name)
+                elif is_pdf:
+                    base64_pdf = _pdf_base64(record["id"])
+                    pdf_display = f"""
+                    <iframe src="data:application/pdf;base64,{base64_pdf}" 
+                            width="100%" height="500px" 
+                            style="border:1px solid #444;"></iframe>
+                    """
+                    st.markdown(pdf_display, unsafe_allow_html=True)
+                st.download_button("Download", file_bytes, file_name,
+                                   "application/pdf" if is_pdf else None,
+                                   key=f"download_{record['id']}")
 
 # --- Patient Portal ---
 def patient_portal():
@@ -130,35 +217,16 @@ def patient_portal():
     st.write(f"Welcome, {st.session_state.username}")
     logout_button()
 
-    user_data = st.session_state.users[st.session_state.username]
+    db = _get_db()
+    folder_names = db.folders(st.session_state.username)
     
     # Medical Summary
     with st.container(border=True):
         st.subheader("📋 Medical Summary")
         
-        # Get all records from all folders
-        all_records = []
-        for folder in user_data["medical_history"].values():
-            all_records.extend(folder)
-        
-        # Sort all records by date (newest first)
-        all_records_sorted = sorted(all_records, 
-                                  key=lambda x: x.get("timestamp", ""), 
-                                  reverse=True)
-        
-        # Extract summary data
-        combined_allergies = set()
-        current_medications = []
-        
-        for record in all_records_sorted:
-            if record.get("allergies", "").strip():
-                combined_allergies.update(a.strip().title() for a in record["allergies"].split(","))
-            if record.get("medications", "").strip():
-                current_medications.append({
-                    "medications": record["medications"],
-                    "doctor": record.get("doctor", "Unknown"),
-                    "date": record.get("timestamp", "Unknown date")
-                })
+        summary = db.summary(st.session_state.username)
+        combined_allergies = summary["allergies"]
+        current_medications = summary["medications"]
         
         col1, col2 = st.columns(2)
         with col1:
@@ -174,7 +242,7 @@ def patient_portal():
             with st.container(border=True):
                 st.markdown("### 💊 Current Medications")
                 if current_medications:
-                    for med in current_medications[:3]:  # Show most recent 3
+                    for med in current_medications:  # Most recent 3
                         st.markdown(f"- {med['medications']} (Prescribed by Dr. {med['doctor']})")
                 else:
                     st.info("No medications recorded")
@@ -193,13 +261,7 @@ def patient_portal():
                     st.error("Please enter your symptoms")
                 else:
                     with st.spinner("Analyzing symptoms..."):
-                        user_symptoms = [s.strip().lower() for s in user_input.split(",")]
-                        symptoms_vector = np.array([
-                            1 if symptom in user_symptoms else 0 for symptom in all_symptoms
-                        ]).reshape(1, -1)
-                        
-                        prediction = model.predict(symptoms_vector)
-                        predicted_condition = str(prediction[0])
+                        predicted_condition = predict_conditions([user_input])[0]
                         
                         st.success("Analysis Complete")
                         with st.container(border=True):
@@ -217,12 +279,12 @@ def patient_portal():
     with st.container(border=True):
         st.subheader("📁 Medical History Folders")
         
-        if not user_data["medical_history"]:
+        if not folder_names:
             st.info("No medical records available yet.")
         else:
             # Display folder selection buttons
             cols = st.columns(4)
-            for i, folder_name in enumerate(user_data["medical_history"].keys()):
+            for i, folder_name in enumerate(folder_names):
                 with cols[i % 4]:
                     if st.button(f"📂 {folder_name}"):
                         st.session_state.selected_folder = folder_name
@@ -230,12 +292,11 @@ def patient_portal():
             # Display records from selected folder
             if "selected_folder" in st.session_state:
                 st.subheader(f"📜 {st.session_state.selected_folder} Records")
-                folder_records = user_data["medical_history"][st.session_state.selected_folder]
-                sorted_records = sorted(folder_records, 
-                                      key=lambda x: x.get("timestamp", ""), 
-                                      reverse=True)
+                folder = st.session_state.selected_folder
+                folder_records = _folder_records(st.session_state.username, folder,
+                                                 db.folder_version(st.session_state.username, folder))
                 
-                for record in sorted_records:
+                for record in folder_records:
                     display_record(record)
 
 # --- Doctor Portal ---
@@ -244,33 +305,23 @@ def doctor_portal():
     st.write(f"Welcome, Dr. {st.session_state.username}")
     logout_button()
 
-    # Get all patients (users with role "Patient")
-    patient_list = [u for u in st.session_state.users if st.session_state.users[u]["role"] == "Patient"]
+    db = _get_db()
+    patient_list = db.patients()
     
     if not patient_list:
         st.info("No patients registered.")
         return
     
     selected_patient = st.selectbox("Select Patient", patient_list)
-    patient_data = st.session_state.users[selected_patient]
+    folder_names = db.folders(selected_patient)
     
     # Summary
     with st.container(border=True):
         st.subheader(f"👤 Patient Summary: {selected_patient}")
         
-        # Get all records from all folders
-        all_records = []
-        for folder in patient_data["medical_history"].values():
-            all_records.extend(folder)
-        
-        combined_allergies = set()
-        treatments_count = 0
-        
-        for record in all_records:
-            if record.get("allergies", "").strip():
-                combined_allergies.update(a.strip().title() for a in record["allergies"].split(","))
-            if record.get("treatment", "").strip():
-                treatments_count += 1
+        summary = db.summary(selected_patient)
+        combined_allergies = summary["allergies"]
+        treatments_count = summary["treatments_count"]
 
         col1, col2 = st.columns(2)
         with col1:
@@ -287,9 +338,7 @@ def doctor_portal():
                 st.markdown("### 📅 Treatment History")
                 if treatments_count > 0:
                     st.markdown(f"Total treatments: {treatments_count}")
-                    if all_records:
-                        latest = sorted(all_records, key=lambda x: x.get("timestamp", ""), reverse=True)[0]
-                        st.markdown(f"Last treatment on {latest.get('timestamp', 'Unknown date')}")
+                    st.markdown(f"Last treatment on {format_ts(summary['latest']) if summary['latest'] else 'Unknown date'}")
                 else:
                     st.info("No treatments recorded")
 
@@ -298,17 +347,16 @@ def doctor_portal():
     with st.container(border=True):
         st.subheader("📁 Patient Medical Folders")
         
-        if not patient_data["medical_history"]:
+        if not folder_names:
             st.info("No medical records available.")
         else:
             # Display folder selection
-            folder_names = list(patient_data["medical_history"].keys())
             selected_folder = st.selectbox("Select Folder", folder_names)
             
             # Display records from selected folder
             if selected_folder:
                 st.subheader(f"📋 {selected_folder} Records")
-                folder_records = patient_data["medical_history"][selected_folder]
+                version = db.folder_version(selected_patient, selected_folder)
                 
                 # Filter options
                 col1, col2 = st.columns(2)
@@ -318,22 +366,17 @@ def doctor_portal():
                     if not show_all:
                         doctor_filter = st.selectbox(
                             "Filter by doctor",
-                            ["All"] + list(sorted({r.get("doctor", "Unknown") for r in folder_records})))
+                            ["All"] + _folder_doctors(selected_patient, selected_folder, version))
                 
                 # Filter records
-                if show_all:
-                    filtered_records = folder_records
+                if show_all or doctor_filter == "All":
+                    filtered_records = _folder_records(selected_patient, selected_folder, version)
                 else:
-                    if doctor_filter == "All":
-                        filtered_records = folder_records
-                    else:
-                        filtered_records = [r for r in folder_records if r.get("doctor", "Unknown") == doctor_filter]
+                    filtered_records = _folder_records(selected_patient, selected_folder, version,
+                                                       doctor_filter)
                 
                 # Display filtered records
-                sorted_records = sorted(filtered_records, 
-                                      key=lambda x: x.get("timestamp", ""), 
-                                      reverse=True)
-                for record in sorted_records:
+                for record in filtered_records:
                     display_record(record)
 
     # Update Form
@@ -346,8 +389,8 @@ def doctor_portal():
                 # Create new folder or select existing
                 folder_option = st.radio("Folder", ["Existing", "New"])
                 if folder_option == "Existing":
-                    if patient_data["medical_history"]:
-                        folder_name = st.selectbox("Select folder", list(patient_data["medical_history"].keys()))
+                    if folder_names:
+                        folder_name = st.selectbox("Select folder", folder_names)
                     else:
                         st.info("No existing folders. Please create a new one.")
                         folder_name = st.text_input("New folder name")
@@ -368,135 +411,123 @@ def doctor_portal():
                     "allergies": allergies,
                     "treatment": treatment,
                     "medications": medications,
-                    "timestamp": str(datetime.datetime.now())
+                    "ts": datetime.datetime.now()
                 }
                 if uploaded_file:
                     new_record["file"] = {
                         "name": uploaded_file.name,
-                        "bytes": uploaded_file.read()
+                        "bytes": uploaded_file.getvalue()
                     }
                 
-                # Initialize folder if it doesn't exist
-                if folder_name not in patient_data["medical_history"]:
-                    patient_data["medical_history"][folder_name] = []
-                
-                # Add record to folder
-                patient_data["medical_history"][folder_name].append(new_record)
-                
-                # Update doctor-patient relationship
-                if st.session_state.username not in patient_data.get("doctors", []):
-                    if "doctors" not in patient_data:
-                        patient_data["doctors"] = []
-                    patient_data["doctors"].append(st.session_state.username)
+                # Add record to folder (created if it doesn't exist); also
+                # links the doctor to the patient
+                db.add_record(selected_patient, folder_name, new_record)
                 
                 st.success(f"Record added to '{folder_name}' successfully")
                 st.rerun()
 
 # --- Main App ---
+# Widget overrides on top of the dark theme
+_CSS = """
+<style>
+    /* All text white */
+    body, .stMarkdown, .stMarkdown p, .stMarkdown li, 
+    .stTextInput>div>div>input, .stTextArea>div>div>textarea,
+    .stSelectbox>div>div>select, .stRadio>div {
+        color: #ffffff !important;
+    }
+    
+    /* Headers - white and bold */
+    .stMarkdown h1, .stMarkdown h2, .stMarkdown h3 {
+        color: #ffffff !important;
+        font-weight: 700 !important;
+    }
+    
+    /* Containers - dark gray with lighter gray border */
+    .stContainer, .st-bb, .st-at, .st-expander {
+        background-color: #1a1a1a !important;
+        border: 1px solid #444 !important;
+        color: #ffffff !important;
+    }
+    
+    /* Buttons - blue with white text */
+    .stButton>button {
+        background-color: #1e88e5 !important;
+        color: white !important;
+        border: none !important;
+    }
+    
+    /* Input fields - dark gray with gray border */
+    .stTextInput>div>div>input, 
+    .stTextArea>div>div>textarea,
+    .stSelectbox>div>div>select,
+    .stFileUploader>div>div {
+        background-color: #333 !important;
+        border: 1px solid #444 !important;
+        color: white !important;
+    }
+    
+    /* Info boxes - dark blue background, white text */
+    .stAlert, .stInfo {
+        background-color: #0d47a1 !important;
+        color: #ffffff !important;
+        border: 1px solid #1976d2 !important;
+    }
+    
+    /* Success messages - dark green background, white text */
+    .stSuccess {
+        background-color: #2e7d32 !important;
+        color: #ffffff !important;
+        border: 1px solid #4caf50 !important;
+    }
+    
+    /* Error messages - dark red background, white text */
+    .stError {
+        background-color: #c62828 !important;
+        color: #ffffff !important;
+        border: 1px solid #f44336 !important;
+    }
+    
+    /* Dividers - gray */
+    .stDivider {
+        border-color: #444 !important;
+    }
+    
+    /* Radio buttons - white text */
+    .stRadio label {
+        color: white !important;
+    }
+    
+    /* Selectbox dropdown - dark background */
+    .stSelectbox div[data-baseweb="select"] > div {
+        background-color: #333 !important;
+        color: white !important;
+    }
+    
+    /* Dropdown options - dark background */
+    .stSelectbox div[role="listbox"] {
+        background-color: #333 !important;
+        color: white !important;
+    }
+    
+    /* File uploader - dark background */
+    .stFileUploader>div>div {
+        background-color: #333 !important;
+    }
+    
+    /* Folder buttons */
+    .stButton>button {
+        width: 100%;
+        margin-bottom: 0.5rem;
+    }
+</style>
+"""
+
 def main_app():
     st.set_page_config(page_title="AI Healthcare", page_icon="🩺", layout="wide")
     
-    # Dark theme CSS
-    st.markdown("""
-    <style>
-        /* Main background - black */
-        .stApp {
-            background-color: #000000 !important;
-            color: #ffffff !important;
-        }
-        
-        /* All text white */
-        body, .stMarkdown, .stMarkdown p, .stMarkdown li, 
-        .stTextInput>div>div>input, .stTextArea>div>div>textarea,
-        .stSelectbox>div>div>select, .stRadio>div {
-            color: #ffffff !important;
-        }
-        
-        /* Headers - white and bold */
-        .stMarkdown h1, .stMarkdown h2, .stMarkdown h3 {
-            color: #ffffff !important;
-            font-weight: 700 !important;
-        }
-        
-        /* Containers - dark gray with lighter gray border */
-        .stContainer, .st-bb, .st-at, .st-expander {
-            background-color: #1a1a1a !important;
-            border: 1px solid #444 !important;
-            color: #ffffff !important;
-        }
-        
-        /* Buttons - blue with white text */
-        .stButton>button {
-            background-color: #1e88e5 !important;
-            color: white !important;
-            border: none !important;
-        }
-        
-        /* Input fields - dark gray with gray border */
-        .stTextInput>div>div>input, 
-        .stTextArea>div>div>textarea,
-        .stSelectbox>div>div>select,
-        .stFileUploader>div>div {
-            background-color: #333 !important;
-            border: 1px solid #444 !important;
-            color: white !important;
-        }
-        
-        /* Info boxes - dark blue background, white text */
-        .stAlert, .stInfo {
-            background-color: #0d47a1 !important;
-            color: #ffffff !important;
-            border: 1px solid #1976d2 !important;
-        }
-        
-        /* Success messages - dark green background, white text */
-        .stSuccess {
-            background-color: #2e7d32 !important;
-            color: #ffffff !important;
-            border: 1px solid #4caf50 !important;
-        }
-        
-        /* Error messages - dark red background, white text */
-        .stError {
-            background-color: #c62828 !important;
-            color: #ffffff !important;
-            border: 1px solid #f44336 !important;
-        }
-        
-        /* Dividers - gray */
-        .stDivider {
-            border-color: #444 !important;
-        }
-        
-        /* Radio buttons - white text */
-        .stRadio label {
-            color: white !important;
-        }
-        
-        /* Selectbox dropdown - dark background */
-        .stSelectbox div[data-baseweb="select"] > div {
-            background-color: #333 !important;
-            color: white !important;
-        }
-        
-        /* Dropdown options - dark background */
-        .stSelectbox div[role="listbox"] {
-            background-color: #333 !important;
-            color: white !important;
-        }
-        
-        /* File uploader - dark background */
-        .stFileUploader>div>div {
-            background-color: #333 !important;
-        }
-        
-        /* Folder buttons */
-        .stButton>button {
-            width: 100%;
-            margin-bottom: 0.5rem;
-        }
-    </style>
-    """, unsafe_allow_html=True)
+    # Dark theme CSS (base colours come from .streamlit/config.toml)
+    st.markdown(_CSS, unsafe_allow_html=True)
     
     st.title("🩺 AI Healthcare Assistant")
     if not st.session_state.logged_in:
@@ -0,0 +1,264 @@
+import datetime
+import sqlite3
+import threading
+
+import zstandard as zstd
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    pwd_hash BLOB NOT NULL,
+    role TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS folders (
+    username TEXT NOT NULL REFERENCES users(username),
+    name TEXT NOT NULL,
+    PRIMARY KEY (username, name)
+);
+
+CREATE TABLE IF NOT EXISTS records (
+    id TEXT PRIMARY KEY,
+    username TEXT NOT NULL REFERENCES users(username),
+    folder TEXT NOT NULL,
+    ts REAL NOT NULL,
+    doctor TEXT,
+    allergies TEXT,
+    treatment TEXT,
+    medications TEXT,
+    file_name TEXT
+);
+CREATE INDEX IF NOT EXISTS records_by_user ON records(username, ts DESC);
+CREATE INDEX IF NOT EXISTS records_by_folder ON records(username, folder, ts DESC);
+CREATE INDEX IF NOT EXISTS records_by_doctor ON records(username, folder, doctor, ts DESC);
+
+CREATE TABLE IF NOT EXISTS files (
+    record_id TEXT PRIMARY KEY REFERENCES records(id),
+    blob BLOB NOT NULL
+);
+
+-- Allergies are aggregated on insert so the summary never rescans records
+CREATE TABLE IF NOT EXISTS allergies (
+    username TEXT NOT NULL REFERENCES users(username),
+    allergy TEXT NOT NULL,
+    PRIMARY KEY (username, allergy)
+);
+
+CREATE TABLE IF NOT EXISTS patient_doctors (
+    patient TEXT NOT NULL REFERENCES users(username),
+    doctor TEXT NOT NULL REFERENCES users(username),
+    PRIMARY KEY (patient, doctor)
+);
+"""
+
+
+def _add_column(conn, table, column, decl):
+    # Databases from before versioning may already have the column
+    columns = {r["name"] for r in conn.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+def _add_patient_summaries(conn):
+    # Per-patient totals kept current by add_record(), so summaries never rescan records
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS patient_summaries ("
+        " username TEXT PRIMARY KEY REFERENCES users(username),"
+        " treatments_count INTEGER NOT NULL DEFAULT 0,"
+        " latest REAL)")
+    conn.execute(
+        "INSERT OR REPLACE INTO patient_summaries (username, treatments_count, latest)"
+        " SELECT username, COUNT(CASE WHEN TRIM(treatment) != '' THEN 1 END), MAX(ts)"
+        " FROM records GROUP BY username")
+    # Lets the latest-medications query stop after three rows
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS records_with_medications ON records(username, ts DESC)"
+        " WHERE TRIM(medications) != ''")
+
+
+# Upgrades applied on top of SCHEMA, in order; PRAGMA user_version counts those done.
+# Append new steps here rather than editing SCHEMA so existing databases keep their data.
+MIGRATIONS = [
+    # Bumped on every insert into the folder; keys the app's record caches
+    lambda conn: _add_column(conn, "folders", "version", "INTEGER NOT NULL DEFAULT 0"),
+    # 'zstd' when the blob is compressed, NULL when stored as uploaded
+    lambda conn: _add_column(conn, "files", "codec", "TEXT"),
+    _add_patient_summaries,
+]
+
+
+class HealthcareDB:
+    """Users and medical records stored in SQLite, safe to share across sessions"""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+            self._migrate()
+
+    def _migrate(self):
+        done = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        for version, migration in enumerate(MIGRATIONS[done:], start=done + 1):
+            with self._conn:
+                self._conn.execute("BEGIN")
+                migration(self._conn)
+                self._conn.execute(f"PRAGMA user_version = {version}")
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    # --- Users ---
+    def add_user(self, username, pwd_hash, role):
+        """Create a user; returns False if the username is taken"""
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT INTO users (username, pwd_hash, role) VALUES (?, ?, ?)",
+                    (username, pwd_hash, role))
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def get_user(self, username):
+        rows = self._query("SELECT username, pwd_hash, role FROM users WHERE username = ?",
+                           (username,))
+        return rows[0] if rows else None
+
+    def patients(self):
+        rows = self._query("SELECT username FROM users WHERE role = 'Patient' ORDER BY rowid")
+        return [r["username"] for r in rows]
+
+    # --- Medical History ---
+    def folders(self, username):
+        rows = self._query("SELECT name FROM folders WHERE username = ? ORDER BY rowid",
+                           (username,))
+        return [r["name"] for r in rows]
+
+    def folder_version(self, username, folder):
+        rows = self._query("SELECT version FROM folders WHERE username = ? AND name = ?",
+                           (username, folder))
+        return rows[0]["version"] if rows else None
+
+    def add_record(self, username, folder, record):
+        """Store a record (and its attachment) and update the patient's aggregates"""
+        file = record.get("file")
+        if file:
+            blob, codec = _pack(file["bytes"])
+        allergies = {a.strip().title() for a in record.get("allergies", "").split(",") if a.strip()}
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO folders (username, name) VALUES (?, ?)"
+                " ON CONFLICT (username, name) DO UPDATE SET version = version + 1",
+                (username, folder))
+            self._conn.execute(
+                "INSERT INTO records (id, username, folder, ts, doctor, allergies,"
+                " treatment, medications, file_name) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (record["id"], username, folder, record["ts"].timestamp(),
+                 record.get("doctor"), record.get("allergies", ""),
+                 record.get("treatment", ""), record.get("medications", ""),
+                 file["name"] if file else None))
+            if file:
+                self._conn.execute(
+                    "INSERT INTO files (record_id, blob, codec) VALUES (?, ?, ?)",
+                    (record["id"], blob, codec))
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO allergies (username, allergy) VALUES (?, ?)",
+                [(username, a) for a in allergies])
+            self._conn.execute(
+                "INSERT INTO patient_summaries (username, treatments_count, latest)"
+                " VALUES (?, ?, ?) ON CONFLICT (username) DO UPDATE SET"
+                " treatments_count = treatments_count + excluded.treatments_count,"
+                " latest = MAX(COALESCE(latest, 0), excluded.latest)",
+                (username, 1 if record.get("treatment", "").strip() else 0,
+                 record["ts"].timestamp()))
+            if record.get("doctor"):
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO patient_doctors (patient, doctor) VALUES (?, ?)",
+                    (username, record["doctor"]))
+
+    def folder_records(self, username, folder, doctor=None):
+        """Records of a folder, newest first, optionally only those by one doctor;
+        attachments are loaded with file_bytes()"""
+        if doctor is None:
+            rows = self._query(
+                "SELECT * FROM records WHERE username = ? AND folder = ? ORDER BY ts DESC",
+                (username, folder))
+        else:
+            rows = self._query(
+                "SELECT * FROM records WHERE username = ? AND folder = ? AND doctor = ?"
+                " ORDER BY ts DESC",
+                (username, folder, doctor))
+        return [_record(r) for r in rows]
+
+    def folder_doctors(self, username, folder):
+        """Doctors who added records to a folder, sorted by name"""
+        rows = self._query(
+            "SELECT DISTINCT doctor FROM records"
+            " WHERE username = ? AND folder = ? AND doctor IS NOT NULL ORDER BY doctor",
+            (username, folder))
+        return [r["doctor"] for r in rows]
+
+    def file_bytes(self, record_id):
+        rows = self._query("SELECT blob, codec FROM files WHERE record_id = ?", (record_id,))
+        if not rows:
+            return None
+        if rows[0]["codec"] == "zstd":
+            return zstd.ZstdDecompressor().decompress(rows[0]["blob"])
+        return rows[0]["blob"]
+
+    def summary(self, username):
+        """Allergies, three latest medications, treatment count and latest record time"""
+        allergies = {r["allergy"] for r in self._query(
+            "SELECT allergy FROM allergies WHERE username = ?", (username,))}
+        medications = [
+            {"medications": r["medications"], "doctor": r["doctor"] or "Unknown",
+             "date": datetime.datetime.fromtimestamp(r["ts"])}
+            for r in self._query(
+                "SELECT medications, doctor, ts FROM records"
+                " WHERE username = ? AND TRIM(medications) != '' ORDER BY ts DESC LIMIT 3",
+                (username,))]
+        totals = self._query(
+            "SELECT treatments_count, latest FROM patient_summaries WHERE username = ?",
+            (username,))
+        latest = totals[0]["latest"] if totals else None
+        return {
+            "allergies": allergies,
+            "medications": medications,
+            "treatments_count": totals[0]["treatments_count"] if totals else 0,
+            "latest": datetime.datetime.fromtimestamp(latest) if latest else None,
+        }
+
+
+# Formats whose payload is already compressed; zstd can't shrink them
+_COMPRESSED_MAGIC = (
+    b"\x89PNG\r\n\x1a\n",
+    b"\xff\xd8\xff",  # JPEG
+)
+
+
+def _pack(blob):
+    """Compress an attachment for storage, returning (blob, codec)"""
+    if blob.startswith(_COMPRESSED_MAGIC):
+        return blob, None
+    # PDFs vary: text and uncompressed streams shrink, embedded scans don't
+    packed = zstd.ZstdCompressor(level=6).compress(blob)
+    if len(packed) >= len(blob):
+        return blob, None
+    return packed, "zstd"
+
+
+def _record(row):
+    record = {
+        "id": row["id"],
+        "doctor": row["doctor"],
+        "allergies": row["allergies"] or "",
+        "treatment": row["treatment"] or "",
+        "medications": row["medications"] or "",
+        "ts": datetime.datetime.fromtimestamp(row["ts"]),
+    }
+    if row["file_name"]:
+        record["file"] = {"name": row["file_name"]}
+    return record
@@ -1,10 +1,11 @@
 import pandas as pd
 import numpy as np
-import pickle
+import joblib
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report, confusion_matrix  # 👈 Importing evaluation metrics
-from tqdm import tqdm  # 👈 for progress bar
+from skl2onnx import convert_sklearn  # 👈 ONNX export for inference
+from skl2onnx.common.data_types import FloatTensorType
 
 print("🚀 Loading dataset...")
 
@@ -16,17 +17,17 @@ df = df.sample(n=10000, random_state=42).reset_index(drop=True)
 print(f"🧾 Dataset shape: {df.shape}")
 print("🧠 Columns:", df.columns.tolist())
 
-X = df.drop('diseases', axis=1)
-y = df['diseases']
+# float32 matches the app's ONNX input and halves memory versus float64
+X = df.drop('diseases', axis=1).to_numpy(dtype=np.float32)
+y = df['diseases'].to_numpy()
 
 print("✂️ Splitting dataset...")
 X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
 
 print("🏋️ Training model...")
-model = RandomForestClassifier(n_estimators=100, random_state=42)
-
-for _ in tqdm(range(1), desc="🔄 Training Progress"):
-    model.fit(X_train, y_train)
+model = RandomForestClassifier(n_estimators=50, max_depth=25, max_features='sqrt',
+                               n_jobs=-1, random_state=42)  # 👈 trees train on all cores
+model.fit(X_train, y_train)
 
 print("🎯 Model training complete.")
 
@@ -38,7 +39,15 @@ print(classification_report(y_test, y_pred))
 print("Confusion Matrix:")
 print(confusion_matrix(y_test, y_pred))
 
-with open('model/disease_predictor.pkl', 'wb') as f:
-    pickle.dump(model, f)
+joblib.dump(model, 'model/disease_predictor.joblib', compress=("lz4", 3))  # 👈 needs the lz4 package
+
+print("💾 Model saved as disease_predictor.joblib")
+
+# The app serves predictions from the ONNX graph through ONNX Runtime
+onx = convert_sklearn(model,
+                      initial_types=[("X", FloatTensorType([None, X.shape[1]]))],
+                      options={id(model): {"zipmap": False}})
+with open('model/disease_predictor.onnx', 'wb') as f:
+    f.write(onx.SerializeToString())
 
-print("💾 Model saved as disease_predictor.pkl")
+print("💾 Model exported as disease_predictor.onnx")